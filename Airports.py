@@ -1,3 +1,6 @@
+import math
+
+import numpy as np
 import pygame
 import Runways
 
@@ -5,6 +8,41 @@ class Airport:
     """Create an Airport object that holds ident, type, name, elevation_ft, continent,
     iso_country, iso_region, municipality, gps_code, iata_code, local_code and coordinates."""
 
+    __slots__ = (
+        "ident",
+        "type",
+        "name",
+        "elevation_ft",
+        "continent",
+        "iso_country",
+        "iso_region",
+        "municipality",
+        "gps_code",
+        "iata_code",
+        "local_code",
+        "coordinates",
+        "runways",
+        "screen",
+        "runway_surface",
+        "runway_lats",
+        "runway_lons",
+        "runway_lengths",
+        "runway_widths",
+        "runways_xywh",
+        "runways_projected_at",
+    )
+    # Runtime and derived render state, kept out of the pickled shelve entries
+    _RENDER_STATE = (
+        "screen",
+        "runway_surface",
+        "runway_lats",
+        "runway_lons",
+        "runway_lengths",
+        "runway_widths",
+        "runways_xywh",
+        "runways_projected_at",
+    )
+
     def __init__(
         self,
         ident,
@@ -19,8 +57,8 @@ class Airport:
         iata_code,
         local_code,
         coordinates,
-        runways,
-        screen,
+        runways=None,
+        screen=None,
     ):
         """Initialize an Airport object."""
         self.ident = ident
@@ -37,8 +75,113 @@ class Airport:
         self.coordinates = coordinates
         self.runways = runways
         self.screen = screen
+        # Solid runway-colored surface that every runway rect is blitted from
+        self.runway_surface = None
+        # Runway columns and their global pixel rects, built on first projection
+        self.runway_lats = None
+        self.runway_lons = None
+        self.runway_lengths = None
+        self.runway_widths = None
+        self.runways_xywh = None
+        self.runways_projected_at = None
+
+    def __getstate__(self):
+        """Pickle only the airport data, not the screen or the derived render state."""
+        return {name: getattr(self, name) for name in self.__slots__ if name not in self._RENDER_STATE}
+
+    def __setstate__(self, state):
+        """Restore the airport data and reset the render state."""
+        for name in self._RENDER_STATE:
+            setattr(self, name, None)
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def _build_runway_columns(self):
+        """Copy the runway positions and sizes into per-column arrays."""
+        runways = self.runways or []
+        self.runway_lats = np.array([runway.lat for runway in runways], dtype=np.float64)
+        self.runway_lons = np.array([runway.lon for runway in runways], dtype=np.float64)
+        self.runway_lengths = np.array([runway.length for runway in runways], dtype=np.float32)
+        self.runway_widths = np.array([runway.width for runway in runways], dtype=np.float32)
+
+    def project_runways(self, map_transform, zoom, tile_size):
+        """Project all runways of an airport to global pixel rects at a zoom level in one pass."""
+        if self.runways_projected_at == (zoom, tile_size):
+            return self.runways_xywh
+        if self.runway_lats is None:
+            self._build_runway_columns()
+        xywh = np.empty((len(self.runway_lats), 4), dtype=np.float64)
+        xywh[:, :2] = map_transform.positions_to_pixels(
+            np.column_stack((self.runway_lons, self.runway_lats)), zoom, tile_size
+        )
+        xywh[:, 2] = self.runway_lengths
+        xywh[:, 3] = self.runway_widths
+        self.runways_xywh = xywh
+        self.runways_projected_at = (zoom, tile_size)
+        return xywh
+
+    def draw_runways(self, offset=(0, 0)):
+        """Draw the projected runways of an airport with a single blits call."""
+        if self.runways_xywh is None or not len(self.runways_xywh):
+            return
+        size = (
+            math.ceil(self.runway_lengths.max()),
+            math.ceil(self.runway_widths.max()),
+        )
+        if self.runway_surface is None or self.runway_surface.get_size() != size:
+            self.runway_surface = pygame.Surface(size, 0, self.screen.screen)
+            self.runway_surface.fill((255, 255, 255))
+        rects = self.runways_xywh.copy()
+        rects[:, :2] -= offset
+        self.screen.screen.blits(
+            [(self.runway_surface, (x, y), (0, 0, w, h)) for x, y, w, h in rects.tolist()],
+            doreturn=0,
+        )
+
+
+def _grid_shape(cell_size):
+    return int(math.ceil(180 / cell_size)), int(math.ceil(360 / cell_size))
+
+
+def _grid_cell(lon, lat, cell_size):
+    rows, cols = _grid_shape(cell_size)
+    row = np.clip(((np.asarray(lat) + 90) // cell_size).astype(np.int64), 0, rows - 1)
+    col = np.clip(((np.asarray(lon) + 180) // cell_size).astype(np.int64), 0, cols - 1)
+    return row, col
+
+
+def build_airport_grid(lon, lat, cell_size=1.0):
+    """Bucket airports into a lat/lon grid, returning the rows sorted by cell and the start of every cell."""
+    rows, cols = _grid_shape(cell_size)
+    row, col = _grid_cell(lon, lat, cell_size)
+    cells = row * cols + col
+    order = np.argsort(cells, kind="stable").astype(np.int32)
+    starts = np.searchsorted(cells[order], np.arange(rows * cols + 1)).astype(np.int32)
+    return order, starts
+
+
+def load_airport_table(path="db/airports.npz"):
+    """Load the columnar airport table written by convert_to_shelve into a dict of arrays."""
+    with np.load(path) as table:
+        return {column: table[column] for column in table.files}
+
 
-    def draw_runways(self):
-        """Draw the runways of an airport."""
-        for runway in self.runways:
-            runway.draw(self.screen)
+def airports_in_bounds(table, bounds):
+    """Return the table rows of the airports within a [west, south, east, north] bounding box."""
+    lon, lat = table["lon"], table["lat"]
+    if "grid_order" in table:
+        # Cells of one grid row are contiguous, so gather a slice per row in view
+        cell_size = float(table["grid_cell_size"])
+        cols = _grid_shape(cell_size)[1]
+        (south, north), (west, east) = _grid_cell(
+            (bounds[0], bounds[2]), (bounds[1], bounds[3]), cell_size
+        )
+        order, starts = table["grid_order"], table["grid_starts"]
+        slices = [order[starts[r * cols + west] : starts[r * cols + east + 1]] for r in range(south, north + 1)]
+        if not slices:
+            return np.empty(0, dtype=np.intp)
+        rows = np.concatenate(slices)
+    else:
+        rows = np.arange(len(lon))
+    mask = (lon[rows] >= bounds[0]) & (lon[rows] <= bounds[2]) & (lat[rows] >= bounds[1]) & (lat[rows] <= bounds[3])
+    return np.sort(rows[mask])
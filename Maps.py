@@ -1,6 +1,44 @@
+import functools
 import math
 from typing import Dict, List, Tuple
 
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _quadkeys_np(tilex: np.ndarray, tiley: np.ndarray, zoom: int, out: np.ndarray) -> None:
+    """Write the ASCII quadkey digits of every tile into the rows of out."""
+    shifts = np.arange(zoom - 1, -1, -1)
+    out[:] = 48 + (((tilex[:, None] >> shifts) & 1) | (((tiley[:, None] >> shifts) & 1) << 1))
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _quadkey_nb(tilex, tiley, zoom, out):
+        for i in range(zoom):
+            digit = ((tilex >> i) & 1) | (((tiley >> i) & 1) << 1)
+            out[zoom - 1 - i] = 48 + digit
+
+    @njit(cache=True)
+    def _quadkeys_nb(tilex, tiley, zoom, out):
+        for n in range(tilex.shape[0]):
+            _quadkey_nb(tilex[n], tiley[n], zoom, out[n])
+
+else:
+    _quadkeys_nb = _quadkeys_np
+
+
+@functools.lru_cache(maxsize=64)
+def _map_size(zoom: float, tile_size: int) -> float:
+    if float(zoom).is_integer():
+        return int(tile_size) << int(zoom)
+    return math.ceil(tile_size * (2.0 ** zoom))
+
 
 class Map:
     """Tile System math for the Spherical Mercator projection coordinate system (EPSG:3857)"""
@@ -11,6 +49,9 @@ class Map:
         self.min_latitude = float(-85.05112878)
         self.max_longitude = float(180)
         self.min_longitude = float(-180)
+        self._deg2rad = math.pi / 180.0
+        self._inv_2pi = 0.5 / math.pi
+        self._inv_360 = 1.0 / 360.0
 
     def clip(self, to_clip: float, min_clip: float, max_clip: float) -> float:
         """Clip a number to a range.
@@ -35,8 +76,11 @@ class Map:
         Returns:
             float: Width and height of the map in pixels.
         """
+        return _map_size(zoom, tile_size)
 
-        return math.ceiling(tile_size * math.pow(2, zoom))
+    def _lat_to_mercator_y(self, lat: float) -> float:
+        """Return the unscaled Mercator y of a latitude in degrees, ln(tan(pi / 4 + lat / 2)) == atanh(sin(lat))."""
+        return math.atanh(math.sin(lat * self._deg2rad))
 
     def ground_resolution(self, lat: float, zoom: float, tile_size: int) -> float:
         """Return the ground resolution (meters per pixel) for a given latitude, zoom level, and tile size.
@@ -54,7 +98,7 @@ class Map:
             * 2
             * math.pi
             * self.radius
-            / self.map_size(zoom, tile_size)
+            / _map_size(zoom, tile_size)
         )
 
     def map_scale(self, lat: float, zoom: float, tile_size: int, dpi: int) -> float:
@@ -83,7 +127,7 @@ class Map:
         Returns:
             float: A position value in the format (longitude, latitude).
         """
-        mapsize = self.map_size(zoom, tile_size)
+        mapsize = _map_size(zoom, tile_size)
         x = (self.clip(pixel[0], 0, mapsize - 1) / mapsize) - 0.5
         y = 0.5 - (self.clip(pixel[1], 0, mapsize - 1) / mapsize)
         return 360 * x, 90 - 360 * math.atan(math.exp(-y * 2 * math.pi)) / math.pi
@@ -101,14 +145,35 @@ class Map:
         """
         latitude = self.clip(position[1], self.min_latitude, self.max_latitude)
         longitude = self.clip(position[0], self.min_longitude, self.max_longitude)
-        x = (longitude + 180) / 360
-        sin_latitude = math.sin(latitude * math.pi / 180)
-        y = 0.5 - (math.log((1 + sin_latitude) / (1 - sin_latitude)) / (4 * math.pi))
-        mapsize = self.map_size(zoom, tile_size)
+        x = (longitude + 180) * self._inv_360
+        y = 0.5 - self._lat_to_mercator_y(latitude) * self._inv_2pi
+        mapsize = _map_size(zoom, tile_size)
         return self.clip(x * mapsize + 0.5, 0, mapsize - 1), self.clip(
             y * mapsize + 0.5, 0, mapsize - 1
         )
 
+    def positions_to_pixels(
+        self, positions: np.ndarray, zoom: int, tile_size: int
+    ) -> np.ndarray:
+        """Converts an array of latitude/longitude WGS-84 coordinates (in degrees) into pixel XY coordinates at a specified level of detail.
+
+        Args:
+            positions (np.ndarray): Position coordinates in the format (longitude, latitude), shape (N, 2).
+            zoom (int): Zoom level.
+            tile_size (int): The size of the tiles in the tile pyramid.
+
+        Returns:
+            np.ndarray: Global pixel coordinates, shape (N, 2).
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        longitude = np.clip(positions[:, 0], self.min_longitude, self.max_longitude)
+        latitude = np.clip(positions[:, 1], self.min_latitude, self.max_latitude)
+        x = (longitude + 180) * self._inv_360
+        y = 0.5 - np.arctanh(np.sin(latitude * self._deg2rad)) * self._inv_2pi
+        mapsize = _map_size(zoom, tile_size)
+        pixels = np.column_stack((x, y)) * mapsize + 0.5
+        return np.clip(pixels, 0, mapsize - 1, out=pixels)
+
     def pixel_to_tilexy(self, pixel: float, tile_size: int) -> float:
         """Converts pixel XY coordinates into tile XY coordinates of the tile containing the specified pixel.
 
@@ -132,27 +197,24 @@ class Map:
         Returns:
             float: The scaled global pixel value.
         """
-        scale = math.power(2, new_zoom - old_zoom)
+        scale = 2.0 ** (new_zoom - old_zoom)
         return pixel[0] * scale, pixel[1] * scale
 
     def scale_pixels(
-        self, pixels: List[Dict[float, float]], old_zoom: float, new_zoom: float
-    ) -> List[Dict[float, float]]:
-        """Performs a scale transform on a list of global pixel values from one zoom level to another.
+        self, pixels: np.ndarray, old_zoom: float, new_zoom: float
+    ) -> np.ndarray:
+        """Performs a scale transform on an array of global pixel values from one zoom level to another.
 
         Args:
-            pixels (List[Dict[float, float]]): A list of global pixel value from the old zoom level. Points are in the format of (x, y).
+            pixels (np.ndarray): Global pixel values from the old zoom level, shape (N, 2). Points are in the format of (x, y).
             old_zoom (float): The zoom level in which the input global pixel values is from.
             new_zoom (float): The new zoom level in which the output global pixel values should be aligned with.
 
         Returns:
-            float: A list of global pixel values that has been scaled for the new zoom level.
+            np.ndarray: Global pixel values that have been scaled for the new zoom level, shape (N, 2).
         """
-        scale = math.power(2, new_zoom - old_zoom)
-        output = []
-        for pixel in pixels:
-            output.append(pixel[0] * scale, pixel[1] * scale)
-        return output
+        scale = np.float64(2.0) ** (new_zoom - old_zoom)
+        return np.asarray(pixels, dtype=np.float64) * scale
 
     def tilexy_to_pixel(self, tilex: int, tiley: int, tilesize: int) -> float:
         """Converts tile XY coordinates into pixel XY coordinates of the upper-left pixel of the specified tile.
@@ -189,6 +251,27 @@ class Map:
             quadkey += str(digit)
         return quadkey
 
+    def tilexy_to_quadkeys(self, tilex: np.ndarray, tiley: np.ndarray, zoom: int) -> List[str]:
+        """Converts arrays of tile XY coordinates into quadkeys at a specified level of detail.
+
+        Args:
+            tilex (np.ndarray): Tile X coordinates.
+            tiley (np.ndarray): Tile Y coordinates.
+            zoom (int): Level of detail, from 1 (lowest detail) to 23 (highest detail).
+
+        Returns:
+            List(str): A quadkey for every tile.
+        """
+        tilex = np.ascontiguousarray(tilex, dtype=np.int64).ravel()
+        tiley = np.ascontiguousarray(tiley, dtype=np.int64).ravel()
+        zoom = int(zoom)
+        if zoom <= 0:
+            return [""] * tilex.size
+        out = np.empty((tilex.size, zoom), dtype=np.uint8)
+        _quadkeys_nb(tilex, tiley, zoom, out)
+        keys = out.tobytes().decode("ascii")
+        return [keys[i : i + zoom] for i in range(0, len(keys), zoom)]
+
     def quadkey_to_tilexy(self, quadkey: str) -> Tuple[int, int, int]:
         """Converts a quadkey into tile XY coordinates.
 
@@ -229,10 +312,9 @@ class Map:
         """
         latitude = self.clip(position[1], self.min_latitude, self.max_latitude)
         longitude = self.clip(position[0], self.min_longitude, self.max_longitude)
-        x = (longitude + 180) / 360
-        sin_latitude = math.sin(latitude * math.pi / 180)
-        y = 0.5 - (math.log((1 + sin_latitude) / (1 - sin_latitude)) / (4 * math.pi))
-        mapsize = self.map_size(zoom, tile_size)
+        x = (longitude + 180) * self._inv_360
+        y = 0.5 - self._lat_to_mercator_y(latitude) * self._inv_2pi
+        mapsize = _map_size(zoom, tile_size)
         tilex = int(
             math.floor(self.clip(x * mapsize + 0.5, 0, mapsize - 1) / tile_size)
         )
@@ -256,15 +338,24 @@ class Map:
         Returns:
             List(str): A list of tile quadkeys.
         """
-        p = self.position_to_tilexy(position, zoom, tile_size)
-        top = p[1] - int(height / tile_size / 2)
-        left = p[0] - int(width / tile_size / 2)
-        bottom = p[1] + int(height / tile_size / 2)
-        right = p[0] + int(width / tile_size / 2)
-        topleft = self.pixel_to_position((left, top), zoom, tile_size)
-        bottomright = self.pixel_to_position((right, bottom), zoom, tile_size)
-        bounds = [topleft[0], bottomright[1], bottomright[0], topleft[1]]
-        return self.quadkey_from_bounds(bounds, zoom, tile_size)
+        mapsize = _map_size(zoom, tile_size)
+        center = self.position_to_pixel(position, zoom, tile_size)
+        topleft = self.pixel_to_tilexy(
+            (
+                self.clip(center[0] - width / 2, 0, mapsize - 1),
+                self.clip(center[1] - height / 2, 0, mapsize - 1),
+            ),
+            tile_size,
+        )
+        # The visible pixel range is half-open, so the last visible pixel is ceil(edge) - 1
+        bottomright = self.pixel_to_tilexy(
+            (
+                self.clip(math.ceil(center[0] + width / 2) - 1, 0, mapsize - 1),
+                self.clip(math.ceil(center[1] + height / 2) - 1, 0, mapsize - 1),
+            ),
+            tile_size,
+        )
+        return self._quadkeys_in_tile_range(topleft, bottomright, zoom)
 
     def quadkey_from_bounds(self, bounds: float, zoom: int, tile_size: int) -> List[str]:
         """Calculates the tile quadkey strings that are within a bounding box at a specific zoom level.
@@ -278,16 +369,22 @@ class Map:
         """        
         keys = []
         if len(bounds) >= 4:
-            topleft, bottomright = self.position_to_tilexy(
-                (bounds[3], bounds[0]), zoom, tile_size
-            ), self.position_to_tilexy((bounds[1], bounds[2]), zoom, tile_size)
-            i = iter(range(topleft[0], bottomright[0] + 1))
-            j = iter(range(topleft[1], bottomright[1] + 1))
-            for x in i:
-                for y in j:
-                    keys.append(self.tilexy_to_quadkey(x, y, zoom))
+            corners = ((bounds[0], bounds[3]), (bounds[2], bounds[1]))
+            tiles = (self.positions_to_pixels(corners, zoom, tile_size) // tile_size).astype(int)
+            keys = self._quadkeys_in_tile_range(tiles[0], tiles[1], zoom)
         return keys
 
+    def _quadkeys_in_tile_range(
+        self, topleft: Tuple[int, int], bottomright: Tuple[int, int], zoom: int
+    ) -> List[str]:
+        """Return the quadkeys of every tile from the top left to the bottom right tile, inclusive."""
+        xs, ys = np.meshgrid(
+            np.arange(topleft[0], bottomright[0] + 1),
+            np.arange(topleft[1], bottomright[1] + 1),
+            indexing="ij",
+        )
+        return self.tilexy_to_quadkeys(xs.ravel(), ys.ravel(), zoom)
+
     def tilexy_to_boundingbox(self, tilex: int, tiley: int, zoom: float, tile_size: int) -> List[Tuple[float, float, float, float]]:
         """Calculates the bounding box of a tile.
 
@@ -333,20 +430,16 @@ class Map:
             bounds_deltax = 360 - (bounds[0] - bounds[2])
             center_lon = float(((bounds[2] + bounds[0]) / 2 + 360) % 360 - 180)
 
-        ry1 = math.log(math.sin(bounds[1] * math.pi / 180) + 1) / math.cos(
-            bounds[1] * math.pi / 180
-        )
-        ry2 = math.log(math.sin(bounds[3] * math.pi / 180) + 1) / math.cos(
-            bounds[3] * math.pi / 180
-        )
+        ry1 = self._lat_to_mercator_y(bounds[1])
+        ry2 = self._lat_to_mercator_y(bounds[3])
         ryc = (ry1 + ry2) / 2
 
-        center_lat = math.atan(math.sin(ryc)) * 180 / math.pi
+        center_lat = math.atan(math.sinh(ryc)) * 180 / math.pi
 
         h_reso = bounds_deltax / (map_width - padding * 2)
 
-        vy0 = math.log(math.tan(math.pi * (0.25 + center_lat / 360)))
-        vy1 = math.log(math.tan(math.pi * (0.25 + bounds[3] / 360)))
+        vy0 = self._lat_to_mercator_y(center_lat)
+        vy1 = self._lat_to_mercator_y(bounds[3])
         zoom_factor = (map_height * 0.5 - padding) / (40.74366543152561 * (vy1 - vy0))
         v_reso = 360.0 / (zoom_factor * tile_size)
         reso = max(h_reso, v_reso)
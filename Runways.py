@@ -1,5 +1,3 @@
-import pygame
-
 class Runway:
     """Create a Runway object that holds position, length, and width of a runway."""
 
@@ -9,16 +7,4 @@ class Runway:
         self.lon = lon
         self.length = length
         self.width = width
-        self.screen = screen
-    
-    def draw(self):
-        """Draw a runway on the screen."""
-        # Convert real world coordinates to screen coordinates
-        screen_x = self.screen.map.convert_real_to_screen_x(self.lon)
-        screen_y = self.screen.map.convert_real_to_screen_y(self.lat)
-        # Draw runway
-        pygame.draw.rect(
-            self.screen.screen,
-            (255, 255, 255),
-            (screen_x, screen_y, self.length, self.width),
-        )
\ No newline at end of file
+        self.screen = screen
\ No newline at end of file
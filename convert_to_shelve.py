@@ -5,30 +5,61 @@ import shelve
 import json
 import unicodedata
 
-from Airports import Airport
+import numpy as np
+
+from Airports import Airport, build_airport_grid
+
+def write_airports_table(airports):
+    """Write the airport positions, types and idents as a columnar table with an ident index."""
+    coordinates = np.array(
+        [[float(c) for c in airport["coordinates"].split(",")] for airport in airports],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    types, type_codes = np.unique([airport["type"] for airport in airports], return_inverse=True)
+    idents = [airport["ident"] for airport in airports]
+    grid_cell_size = 1.0
+    grid_order, grid_starts = build_airport_grid(coordinates[:, 0], coordinates[:, 1], grid_cell_size)
+    np.savez(
+        "db/airports.npz",
+        lon=coordinates[:, 0],
+        lat=coordinates[:, 1],
+        type=type_codes.astype(np.uint8),
+        types=types,
+        ident=np.array(idents, dtype=np.bytes_),
+        grid_cell_size=grid_cell_size,
+        grid_order=grid_order,
+        grid_starts=grid_starts,
+    )
+    with open("db/airports_index.json", "w") as f:
+        json.dump({ident: row for row, ident in enumerate(idents)}, f)
+    print("Amount of airports", len(idents), "in table")
 
 def convert_airports_json():
     """Convert the airports in the json to entries in the airports shelve."""
     with open("datasources/airport-codes_json.json") as f:
         airports = json.load(f)
     print("Amount of airports", len(airports), "in json")
-    with shelve.open("db/airports") as db:
-        for airport in airports:
-            db[airport["ident"]] = Airport(
-                airport["ident"],
-                airport["type"],
-                airport["name"].encode("utf-8"),
-                airport["elevation_ft"],
-                airport["continent"],
-                airport["iso_country"],
-                airport["iso_region"],
-                airport["municipality"],
-                airport["gps_code"],
-                airport["iata_code"],
-                airport["local_code"],
-                airport["coordinates"],
-            )
+    records = {
+        airport["ident"]: Airport(
+            airport["ident"],
+            airport["type"],
+            unicodedata.normalize("NFC", airport["name"]),
+            airport["elevation_ft"],
+            airport["continent"],
+            airport["iso_country"],
+            airport["iso_region"],
+            airport["municipality"],
+            airport["gps_code"],
+            airport["iata_code"],
+            airport["local_code"],
+            airport["coordinates"],
+        )
+        for airport in airports
+    }
+    with shelve.open("db/airports", protocol=5, writeback=False) as db:
+        db.update(records)
         print("Amount of airports", len(db.keys()), "in shelve")
+    write_airports_table(airports)
 
 
 convert_airports_json()
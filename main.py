@@ -39,6 +39,8 @@ class App:
         self.max_zoom_map = 18
         self.min_zoom_map = 1
         self.moving = False
+        self.fps = 60
+        self.clock = pygame.time.Clock()
         self.first_point=(52.366544, 4.825636)
         self.second_point=(52.363799, 4.832556)
 
@@ -46,6 +48,10 @@ class App:
         self.window = pygame.display.set_mode(
             self.size, pygame.DOUBLEBUF | pygame.HWSURFACE | pygame.RESIZABLE
         )
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(
+            [QUIT, VIDEORESIZE, MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION]
+        )
 
         # Load OSMCache from osm module
         self.osm = osm.OSMCache("tilecache\\osm", "imagecache\\osm")
@@ -63,9 +69,18 @@ class App:
             second_point=self.second_point,
             zoom=zoom,
             )
+        self.map = self.map.convert()
         self.maprect = pygame.Rect(0, 0, self.size[0], self.size[1])
+        # (size, surface) of the last smoothscaled map, reused while only panning
+        self._scaled_cache = (None, None)
+        # Screen area covered by the map on the last blit and areas awaiting display update
+        self.old_maprect = self.maprect.copy()
+        self.dirty_rects = []
+        # Set by event handlers, the map is redrawn at most once per frame
+        self._dirty = False
+        self._dirty_full = False
 
-        self.blitmap()
+        self.blitmap(full=True)
 
 
 
@@ -79,10 +94,36 @@ class App:
         # create window
         pygame.display.flip()
 
-    def blitmap(self):
-        self.mapsurface = pygame.transform.smoothscale(self.map, self.maprect.size)
+    def blitmap(self, full=False):
+        if self._scaled_cache[0] == self.maprect.size:
+            self.mapsurface = self._scaled_cache[1]
+        else:
+            self.mapsurface = self.scale_map(self.maprect.size)
+            self._scaled_cache = (self.maprect.size, self.mapsurface)
+        # Only redraw the area the map covered before and covers now
+        window_rect = self.window.get_rect()
+        if full:
+            dirty = window_rect
+        else:
+            dirty = self.old_maprect.union(self.maprect).clip(window_rect)
+        self.window.set_clip(dirty)
         self.window.fill(0)
         self.window.blit(self.mapsurface, self.maprect)
+        self.window.set_clip(None)
+        self.old_maprect = self.maprect.copy()
+        self.dirty_rects.append(dirty)
+
+    def scale_map(self, size):
+        """Scale the map to size, avoiding the bilinear filter when the ratio is a power of two."""
+        width, height = self.map.get_size()
+        if size == (width, height):
+            return self.map
+        if size == (width * 2, height * 2):
+            return pygame.transform.scale2x(self.map)
+        for factor in (2, 4, 8):
+            if size == (width // factor, height // factor) and not width % factor and not height % factor:
+                return pygame.transform.scale(self.map, size)
+        return pygame.transform.smoothscale(self.map, size)
 
     def on_init(self):
         self.rtsim = RTSim()
@@ -99,7 +140,8 @@ class App:
                 event.dict["size"],
                 pygame.DOUBLEBUF | pygame.HWSURFACE | pygame.RESIZABLE,
             )
-            self.blitmap()
+            self._scaled_cache = (None, None)
+            self._dirty = self._dirty_full = True
 
         elif event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 4 or event.button == 5:
@@ -116,7 +158,8 @@ class App:
                     bottom = my + (self.maprect.bottom - my) * zoom_image
                     self.maprect = pygame.Rect(left, top, right - left, bottom - top)
                     self.zoom_image = self.zoom_image * zoom_image
-                    self.blitmap()
+                    self._scaled_cache = (None, None)
+                    self._dirty = True
             elif event.button == 1:
                 if self.maprect.collidepoint(event.pos):
                     self.moving = True
@@ -125,14 +168,19 @@ class App:
                 self.moving = False
         elif event.type == MOUSEMOTION and self.moving:
             self.maprect.move_ip(event.rel)
-            self.blitmap()
-
-        pygame.display.update()
+            self._dirty = True
 
     def on_execute(self):
         while self.running == True:
             for event in pygame.event.get():
                 self.check_event(event)
+            if self._dirty:
+                self.blitmap(full=self._dirty_full)
+                self._dirty = self._dirty_full = False
+            if self.dirty_rects:
+                pygame.display.update(self.dirty_rects)
+                self.dirty_rects = []
+            self.clock.tick(self.fps)
         self.on_cleanup()
 
 
@@ -8,12 +8,25 @@ Will ratelimit.
 """
 
 import os
-import math
-import urllib.request
+import shutil
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import threading
 import time
 
+import numpy as np
 import pygame
+import urllib3
+
+log = logging.getLogger(__name__)
+
+# Number of threads fetching missing tiles concurrently
+FETCH_WORKERS = int(os.environ.get("RTSIM_OSM_WORKERS", 8))
+USER_AGENT = "rtsim/0.1"
+# Decoded tiles kept in memory, 256KB each at 32 bits per pixel
+_MAX_TILES = 256
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
 ZOOMLEVELS = {
     0: { "tiles": 1, "tile_width": 360, "mpixel": 156412, "scale": 1/500000000 }, 
@@ -39,48 +52,120 @@ ZOOMLEVELS = {
     20: { "tiles": 137438953472, "tile_width": 0.00034332275390625, "mpixel": 0.149, "scale": 1/500 },
 }
 
+# ZOOMLEVELS as one array per field, indexed by zoom level
+TILES = np.array([level["tiles"] for level in ZOOMLEVELS.values()], dtype=np.int64)
+TILE_WIDTH_DEG = np.array([level["tile_width"] for level in ZOOMLEVELS.values()], dtype=np.float64)
+MPIXEL = np.array([level["mpixel"] for level in ZOOMLEVELS.values()], dtype=np.float64)
+SCALE = np.array([level["scale"] for level in ZOOMLEVELS.values()], dtype=np.float64)
+# Tiles along one axis, 2**zoom
+N_POW2 = (1 << np.arange(len(ZOOMLEVELS))).astype(np.float64)
+
+ZoomInfo = namedtuple("ZoomInfo", ["tiles", "tile_width", "mpixel", "scale"])
+
+
+def zoom_info(zoom):
+    """Return the tile count, tile width in degrees, meters per pixel and scale of a zoom level."""
+    return ZoomInfo(int(TILES[zoom]), float(TILE_WIDTH_DEG[zoom]), float(MPIXEL[zoom]), float(SCALE[zoom]))
+
+
+def _tiles_per_axis(zoom):
+    if float(zoom).is_integer() and 0 <= zoom < len(N_POW2):
+        return N_POW2[int(zoom)]
+    return 2.0**zoom
+
+class _RateLimiter:
+    """Token bucket allowing rate requests per second in bursts of up to capacity, shared by threads."""
+
+    def __init__(self, rate=2.0, capacity=4):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # Reserve a token now; a negative balance makes later callers wait longer
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+
+
 class OSMCache:
+    TILE_SERVER_URL = "https://tile.openstreetmap.org"
+    # Combined images are cached as JPEG, which is far smaller and quicker to encode than PNG
+    IMAGE_CACHE_EXTENSION = ".jpg"
+
     def __init__(self, tile_cache_dir, image_cache_dir, tile_server_url=None):
         self.tile_cache_dir = tile_cache_dir
         self.image_cache_dir = image_cache_dir
-        self.tile_server_url = tile_server_url or "https://tile.openstreetmap.org"
+        self.tile_server_url = tile_server_url or self.TILE_SERVER_URL
+        # Decoded tile surfaces by (xtile, ytile, zoom), least recently used first
+        self.max_cached_tiles = _MAX_TILES
+        self._tile_surfaces = OrderedDict()
+        # Directories known to exist, so repeated tile writes skip the makedirs call
+        self._ensured_dirs = set()
+        self._limiter = _RateLimiter()
+        # Keep-alive connections to the tile server, shared by the fetch threads
+        self._http = urllib3.PoolManager(
+            num_pools=1, maxsize=16, headers={"User-Agent": USER_AGENT}
+        )
 
-        if not os.path.exists(self.tile_cache_dir):
-            os.makedirs(self.tile_cache_dir)
+        self._ensure_dir(self.tile_cache_dir)
+        self._ensure_dir(self.image_cache_dir)
 
-        if not os.path.exists(self.image_cache_dir):
-            os.makedirs(self.image_cache_dir)
+    def _ensure_dir(self, path):
+        if path not in self._ensured_dirs:
+            os.makedirs(path, exist_ok=True)
+            self._ensured_dirs.add(path)
 
-    def _degrees_to_tile(self, lat, lon, zoom):
-        lat_rad = math.radians(lat)
-        n = 2**zoom
-        xtile = int((lon + 180) / 360 * n)
-        ytile = int(
-            (1 - math.log(math.tan(lat_rad) + (1 / math.cos(lat_rad))) / math.pi)
+    def _degrees_to_tile_vec(self, lat, lon, zoom):
+        lat_rad = np.radians(lat)
+        n = _tiles_per_axis(zoom)
+        xtile = np.floor((np.asarray(lon) + 180) / 360 * n).astype(np.int64)
+        ytile = np.floor(
+            (1 - np.log(np.tan(lat_rad) + (1 / np.cos(lat_rad))) / np.pi)
             / 2
             * n
-        )
-        return (xtile, ytile)
+        ).astype(np.int64)
+        return xtile, ytile
 
-    def _tile_to_degrees(self, xtile, ytile, zoom):
-        n = 2**zoom
-        lon_deg = xtile / n * 360.0 - 180.0
-        lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * ytile / n)))
-        lat_deg = math.degrees(lat_rad)
+    def _degrees_to_tile(self, lat, lon, zoom):
+        xtile, ytile = self._degrees_to_tile_vec(lat, lon, zoom)
+        return (int(xtile), int(ytile))
+
+    def _tile_to_degrees_vec(self, xtile, ytile, zoom):
+        n = _tiles_per_axis(zoom)
+        lon_deg = np.asarray(xtile) / n * 360.0 - 180.0
+        lat_rad = np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(ytile) / n)))
+        lat_deg = np.degrees(lat_rad)
         return lat_deg, lon_deg
 
+    def _tile_to_degrees(self, xtile, ytile, zoom):
+        lat_deg, lon_deg = self._tile_to_degrees_vec(xtile, ytile, zoom)
+        return float(lat_deg), float(lon_deg)
+
     def _get_tile_path(self, xtile, ytile, zoom):
         return os.path.join(
             self.tile_cache_dir, str(zoom), str(xtile), str(ytile) + ".png"
         )
 
-    def _get_image_path(self, name, min_lat, max_lat, min_lon, max_lon, zoom):
-        topleft = self._degrees_to_tile(max_lat, min_lon, zoom)
-        bottomright = self._degrees_to_tile(min_lat, max_lon, zoom)
+    def _tile_range(self, min_lat, max_lat, min_lon, max_lon, zoom):
+        (min_x, max_x), (min_y, max_y) = (
+            tiles.tolist()
+            for tiles in self._degrees_to_tile_vec((max_lat, min_lat), (min_lon, max_lon), zoom)
+        )
+        return (min_x, min_y), (max_x, max_y)
+
+    def _get_image_path(self, name, topleft, bottomright, zoom):
         topleft_string = f"{topleft[0]}_{topleft[1]}"
         bottomright_string = f"{bottomright[0]}_{bottomright[1]}"
         return os.path.join(
-            self.image_cache_dir, name, f"{topleft_string}-{bottomright_string}-{zoom}.png"
+            self.image_cache_dir, name, f"{topleft_string}-{bottomright_string}-{zoom}{self.IMAGE_CACHE_EXTENSION}"
         )
 
     def _get_tile_url(self, xtile, ytile, zoom):
@@ -89,22 +174,53 @@ class OSMCache:
     def _fetch_remote_tile(self, xtile, ytile, zoom):
         url = self._get_tile_url(xtile, ytile, zoom)
         path = self._get_tile_path(xtile, ytile, zoom)
-        if not os.path.exists(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
-        print(f"Fetching {url}")
-        urllib.request.urlretrieve(url, path)
+        self._ensure_dir(os.path.dirname(path))
+        self._limiter.acquire()
+        log.info("Fetching %s", url)
+        response = self._http.request("GET", url, preload_content=False)
+        # Download next to the tile and rename it into place, so an interrupted
+        # download never leaves a truncated PNG in the cache
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        try:
+            if response.status != 200:
+                raise urllib3.exceptions.HTTPError(f"{url} returned HTTP {response.status}")
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(response, f)
+            with open(tmp_path, "rb") as f:
+                if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                    raise ValueError(f"{url} did not return a PNG image")
+            os.replace(tmp_path, path)
+        finally:
+            response.release_conn()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     def _fetch_tile(self, xtile, ytile, zoom):
         path = self._get_tile_path(xtile, ytile, zoom)
         if not os.path.exists(path):
-            print(f"Fetching tile {xtile}, {ytile} remotely")
+            log.info("Fetching tile %d, %d remotely", xtile, ytile)
             self._fetch_remote_tile(xtile, ytile, zoom)
-            time.sleep(1)
         return path
 
+    def _decode_tile(self, xtile, ytile, zoom):
+        return pygame.image.load(self._fetch_tile(xtile, ytile, zoom))
+
+    def _cached_tile(self, key):
+        tile = self._tile_surfaces.get(key)
+        if tile is not None:
+            self._tile_surfaces.move_to_end(key)
+        return tile
+
+    def _cache_tile(self, key, tile):
+        if pygame.display.get_surface() is not None:
+            tile = tile.convert()
+        self._tile_surfaces[key] = tile
+        if len(self._tile_surfaces) > self.max_cached_tiles:
+            self._tile_surfaces.popitem(last=False)
+        return tile
+
     def _write_cached_image(self, image, path):
-        if not os.path.exists(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
+        self._ensure_dir(os.path.dirname(path))
         pygame.image.save(image, path)
 
     def calculate_bounding_box(self, first_point, second_point):
@@ -114,46 +230,69 @@ class OSMCache:
         max_lon = max(first_point[1], second_point[1])
         return min_lat, max_lat, min_lon, max_lon
 
-    def _create_combined_image(self, min_lat, max_lat, min_lon, max_lon, zoom):
-        min_x, min_y = self._degrees_to_tile(max_lat, min_lon, zoom)
-        max_x, max_y = self._degrees_to_tile(min_lat, max_lon, zoom)
-        new_max_lat, new_min_lon = self._tile_to_degrees(min_x, min_y, zoom)
-        new_min_lat, new_max_lon = self._tile_to_degrees(max_x + 1, max_y + 1, zoom)
+    def _create_combined_image(self, topleft, bottomright, zoom):
+        (min_x, min_y), (max_x, max_y) = topleft, bottomright
+        (new_max_lat, new_min_lat), (new_min_lon, new_max_lon) = (
+            degrees.tolist()
+            for degrees in self._tile_to_degrees_vec((min_x, max_x + 1), (min_y, max_y + 1), zoom)
+        )
         pix_width = (max_x - min_x + 1) * 256
         pix_height = (max_y - min_y + 1) * 256
-        print(f"Creating combined image of {pix_width}x{pix_height}")
-        combined_image = pygame.Surface((pix_width, pix_height))
-        combined_image.fill((0, 0, 0))
-        print("Fetching", (1 + max_x - min_x) * (1 + max_y - min_y), "tiles")
-        for xtile in range(min_x, max_x + 1):
-            for ytile in range(min_y, max_y + 1):
-                path = self._fetch_tile(xtile, ytile, zoom)
-                x_off = 256 * (xtile - min_x)
-                y_off = 256 * (ytile - min_y)
-                tile = pygame.image.load(path)
-                combined_image.blit(tile, (x_off, y_off))
+        log.info("Creating combined image of %dx%d", pix_width, pix_height)
+        # Every pixel is covered by a tile, so the canvas is not cleared. Matching the
+        # display format lets the converted tiles blit without per-pixel conversion.
+        display = pygame.display.get_surface()
+        if display is not None:
+            combined_image = pygame.Surface((pix_width, pix_height), 0, display)
+        else:
+            combined_image = pygame.Surface((pix_width, pix_height))
+        if log.isEnabledFor(logging.INFO):
+            log.info("Fetching %d tiles", (1 + max_x - min_x) * (1 + max_y - min_y))
+        tiles = {
+            (xtile, ytile): self._cached_tile((xtile, ytile, zoom))
+            for xtile in range(min_x, max_x + 1)
+            for ytile in range(min_y, max_y + 1)
+        }
+        missing = [xy for xy, tile in tiles.items() if tile is None]
+        if missing:
+            # Fetching and PNG decoding both happen off the main thread
+            with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(missing))) as executor:
+                decoded = executor.map(lambda xy: self._decode_tile(*xy, zoom), missing)
+                for xy, tile in zip(missing, decoded):
+                    tiles[xy] = self._cache_tile((*xy, zoom), tile)
+        combined_image.blits(
+            [
+                (tile, (256 * (xtile - min_x), 256 * (ytile - min_y)))
+                for (xtile, ytile), tile in tiles.items()
+            ],
+            doreturn=0,
+        )
         return combined_image, (new_min_lat, new_max_lat, new_min_lon, new_max_lon)
 
-    def get_combined_image(self, name, first_point, second_point, zoom):
+    def _scale_image(self, image, target_size):
+        if target_size is None or image.get_size() == tuple(target_size):
+            return image
+        return pygame.transform.smoothscale(image, target_size)
+
+    def get_combined_image(self, name, first_point, second_point, zoom, target_size=None):
         min_lat, max_lat, min_lon, max_lon = self.calculate_bounding_box(
             first_point, second_point
         )
         #(max_lat, min_lon), (min_lat, max_lon) = topleft, bottomright
-        image_path = self._get_image_path(name, min_lat, max_lat, min_lon, max_lon, zoom)
-        if not os.path.exists(image_path):
-            combined_image = self._create_combined_image(
-                min_lat, max_lat, min_lon, max_lon, zoom
+        topleft, bottomright = self._tile_range(min_lat, max_lat, min_lon, max_lon, zoom)
+        image_path = self._get_image_path(name, topleft, bottomright, zoom)
+        try:
+            os.stat(image_path)
+        except FileNotFoundError:
+            combined_image, bounds = self._create_combined_image(
+                topleft, bottomright, zoom
             )
-            self._write_cached_image(combined_image[0], image_path)
-            print("Saved combined image to", image_path)
-            return combined_image
-        else:
-            print("Combined image already exists at", image_path)
-            return pygame.image.load(image_path), (min_lat, max_lat, min_lon, max_lon)
-
-opener = urllib.request.build_opener()
-opener.addheaders = [("User-agent", "OSMViz/1.1.0 +https://hugovk.github.io/osmviz")]
-urllib.request.install_opener(opener)
+            self._write_cached_image(combined_image, image_path)
+            log.info("Saved combined image to %s", image_path)
+            return self._scale_image(combined_image, target_size), bounds
+        log.info("Combined image already exists at %s", image_path)
+        image = self._scale_image(pygame.image.load(image_path), target_size)
+        return image, (min_lat, max_lat, min_lon, max_lon)
 
 
 def _temp_test():
@@ -173,4 +312,5 @@ def _temp_test():
         display_surface.blit(image[0], (0, 0))
         pygame.display.update()
 
-_temp_test()
\ No newline at end of file
+if __name__ == "__main__":
+    _temp_test()
\ No newline at end of file